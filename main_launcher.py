@@ -1,48 +1,543 @@
 import os
+import re
 import sys
-import requests
-import importlib
-import litellm
-from litellm import completion
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from functools import lru_cache
+import httpx
 
 # --- PATH CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 if BASE_DIR not in sys.path:
     sys.path.append(BASE_DIR)
 
-def get_relevant_standards(diff_text):
+from agents import documenter_agent, reviewer_agent, security_agent, tester_agent
+
+# --- AGENT REGISTRY ---
+AGENTS = {
+    "documenter": documenter_agent.get_prompt,
+    "reviewer": reviewer_agent.get_prompt,
+    "security": security_agent.get_prompt,
+    "tester": tester_agent.get_prompt,
+}
+
+# Default model per agent when MODEL_NAME is not set: summarization and boilerplate
+# agents run on the smaller model, review and security keep the larger one
+MODEL_BY_AGENT = {
+    "documenter": "gpt-4o-mini",
+    "reviewer": "gpt-4o",
+    "security": "gpt-4o",
+    "tester": "gpt-4o-mini",
+}
+
+# Upper bound on simultaneous LLM calls when AGENT_TYPE is "all"
+MAX_CONCURRENT_AGENTS = 4
+
+# --- LLM BACKEND ---
+# "litellm" supports every provider; "openai" and "azure" call the chat completions endpoint directly
+# with httpx, which avoids installing and importing litellm
+LLM_BACKEND = os.getenv("LLM_BACKEND") or "litellm"
+LLM_BACKENDS = ("litellm", "openai", "azure")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE") or "https://api.openai.com/v1"
+# LiteLLM model prefixes whose provider takes explicit cache_control breakpoints
+CACHE_CONTROL_MODEL_PREFIXES = ("claude-", "anthropic/", "bedrock/", "vertex_ai/claude")
+
+# Persistent response cache (restored/saved by actions/cache in action.yml)
+CACHE_DIR = os.getenv("LLM_CACHE_DIR") or os.path.join(BASE_DIR, ".llm_cache")
+CACHE_TTL_SECONDS = 30 * 24 * 3600   # Older answers are deleted so the saved database stays small
+
+# --- DIFF LIMITS ---
+MAX_DIFF_BYTES = 2_000_000          # Hard cap on the downloaded diff, larger bodies are cut off
+SUMMARIZE_ABOVE_BYTES = 200_000     # Above this size, each file is trimmed to its first hunk lines
+MAX_LINES_PER_FILE = 200
+
+# --- TOKEN BUDGET ---
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "120000"))  # Prompt budget (gpt-4o has a 128k window)
+RESPONSE_RESERVE_TOKENS = 1024
+
+_FILE_SPLIT_RE = re.compile(r'^(?=diff --git )', re.M)
+_FILE_NAME_RE = re.compile(r'^diff --git a/.+? b/(.+)$', re.M)
+# Lockfiles, minified bundles and generated sources: never reviewed alone, dropped first when the diff does not fit
+_GENERATED_FILE_RE = re.compile(
+    r'(?:^|/)(?:package-lock\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|Cargo\.lock)$'
+    r'|\.min\.(?:js|css)$|\.generated\.'
+)
+# Files where indentation carries meaning: re-indenting them is never a whitespace-only change
+_INDENT_SENSITIVE_EXTS = {".py", ".yaml", ".yml"}
+# Code tokens for whitespace-only comparison: string literals (whitespace inside them matters),
+# words, runs of punctuation; `x+1` and `x + 1` match, `return x` and `returnx` do not
+_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|\w+|[^\w\s"\']+|["\']')
+
+TRIVIAL_DIFF_FEEDBACK = "✅ Skipped: trivial/generated-only changes"
+
+@lru_cache(maxsize=32)
+def _read_std(path, mtime):
+    """Read a standards file with canonical line endings so the prompt is OS-independent."""
+    # mtime is only part of the cache key, an edited file gets re-read
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().replace('\r\n', '\n').rstrip() + "\n"
+
+def read_standard(entry):
+    """Return the cached content of a standards file from its os.scandir entry."""
+    return _read_std(entry.path, entry.stat().st_mtime)
+
+GITHUB_API = "https://api.github.com"
+MAX_RETRIES = 5
+
+def github_client():
+    """Create the keep-alive HTTP/2 client shared by every GitHub call of a run."""
+    # Transport-level retries only cover connection failures, HTTP statuses are handled by _should_retry
+    # Pool limits belong to the transport: AsyncClient ignores limits= when transport= is given
+    transport = httpx.AsyncHTTPTransport(http2=True, retries=2, limits=httpx.Limits(max_connections=2))
+    return httpx.AsyncClient(transport=transport, timeout=60)
+
+def llm_client():
+    """Create the HTTP/2 client shared by every direct OpenAI/Azure call of a run."""
+    return httpx.AsyncClient(http2=True, timeout=120)
+
+def _should_retry(response):
+    """Retry rate limits on any request, and gateway errors only on idempotent GETs."""
+    if response.status_code == 429:
+        return True
+    if response.status_code == 403:
+        # Secondary rate limits come as 403 with Retry-After; plain 403s are permission errors
+        return "Retry-After" in response.headers or response.headers.get("x-ratelimit-remaining") == "0"
+    return response.status_code in (502, 503, 504) and response.request.method == "GET"
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before the next attempt, honouring GitHub's Retry-After header."""
+    retry_after = response.headers.get("Retry-After", "")
+    return int(retry_after) if retry_after.isdigit() else 0.5 * 2 ** attempt
+
+async def github_request(client, method, url, **kwargs):
+    """Send a GitHub API request, backing off and retrying on rate limits."""
+    for attempt in range(MAX_RETRIES):
+        response = await client.request(method, url, **kwargs)
+        if not _should_retry(response):
+            return response
+        await asyncio.sleep(_retry_delay(response, attempt))
+    return await client.request(method, url, **kwargs)
+
+async def fetch_diff(client, repo, pr_number, github_token):
+    """Stream the PR diff in one request, stopping once MAX_DIFF_BYTES have been received."""
+    url = f"{GITHUB_API}/repos/{repo}/pulls/{pr_number}"
+    headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3.diff"}
+    for attempt in range(MAX_RETRIES + 1):
+        async with client.stream("GET", url, headers=headers) as response:
+            if attempt < MAX_RETRIES and _should_retry(response):
+                delay = _retry_delay(response, attempt)
+            elif response.is_error:
+                # A JSON error body must never be mistaken for the diff
+                await response.aread()
+                raise httpx.HTTPStatusError(
+                    f"GitHub returned {response.status_code} for the diff: {response.text[:500]}",
+                    request=response.request, response=response
+                )
+            else:
+                raw = bytearray()
+                async for chunk in response.aiter_bytes():
+                    raw += chunk
+                    if len(raw) >= MAX_DIFF_BYTES:
+                        break
+                return bytes(raw[:MAX_DIFF_BYTES])
+        await asyncio.sleep(delay)
+
+PR_METADATA_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      title
+      baseRefOid
+      headRefOid
+      labels(first: 20) { nodes { name } }
+      files(first: 100) { totalCount nodes { path additions deletions } }
+    }
+  }
+}
+"""
+
+async def fetch_pr_metadata(client, repo, pr_number, github_token):
+    """Fetch title, base/head SHAs, labels and changed files of the PR in one GraphQL request.
+
+    Returns None on any failure: the metadata is optional and callers fall back to the diff.
+    """
+    try:
+        owner, name = repo.split("/", 1)
+        response = await github_request(
+            client, "POST", f"{GITHUB_API}/graphql",
+            headers={"Authorization": f"bearer {github_token}"},
+            json={"query": PR_METADATA_QUERY, "variables": {"owner": owner, "name": name, "number": int(pr_number)}}
+        )
+        data = response.json() if response.is_success else {}
+        pull_request = ((data.get("data") or {}).get("repository") or {}).get("pullRequest")
+    except Exception as e:
+        print(f"Could not fetch PR metadata: {e}")
+        return None
+    if pull_request is None:
+        print(f"Could not fetch PR metadata: {data.get('errors') or response.status_code}")
+    return pull_request
+
+def changed_file_paths(pull_request):
+    """Return the PR's changed file paths, or None when the metadata is missing or truncated."""
+    if not pull_request:
+        return None
+    files = pull_request["files"]
+    if files["totalCount"] > len(files["nodes"]):
+        return None
+    return [node["path"] for node in files["nodes"]]
+
+async def post_comment(client, repo, pr_number, github_token, body):
+    """Post body as a comment on the pull request."""
+    comment_url = f"{GITHUB_API}/repos/{repo}/issues/{pr_number}/comments"
+    return await github_request(client, "POST", comment_url, headers={"Authorization": f"token {github_token}"}, json={"body": body})
+
+class PRComment:
+    """A pull request comment created on the first write and edited in place afterwards."""
+
+    MIN_CHARS = 500         # Partial output shorter than this is not worth a comment yet
+    UPDATE_INTERVAL = 2.0   # Seconds between two edits while the answer is streaming
+
+    def __init__(self, client, repo, pr_number, github_token):
+        self.client = client
+        self.repo = repo
+        self.pr_number = pr_number
+        self.github_token = github_token
+        self.comment_id = None
+        self._last_update = time.monotonic()
+        self._progress_enabled = True
+
+    async def write(self, body):
+        """Create the comment, or replace its body if it already exists. Raises httpx.HTTPError on failure."""
+        if self.comment_id is None:
+            response = await post_comment(self.client, self.repo, self.pr_number, self.github_token, body)
+            response.raise_for_status()
+            self.comment_id = response.json()["id"]
+        else:
+            url = f"{GITHUB_API}/repos/{self.repo}/issues/comments/{self.comment_id}"
+            response = await github_request(self.client, "PATCH", url, headers={"Authorization": f"token {self.github_token}"}, json={"body": body})
+            response.raise_for_status()
+
+    async def update(self, parts):
+        """Show the chunks streamed so far, at most once every UPDATE_INTERVAL seconds (best effort)."""
+        now = time.monotonic()
+        if not self._progress_enabled or now - self._last_update < self.UPDATE_INTERVAL:
+            return
+        partial = "".join(parts)
+        if len(partial) < self.MIN_CHARS:
+            return
+        self._last_update = now
+        try:
+            await self.write(f"{partial}\n\n_⏳ Generating..._")
+        except httpx.HTTPError as e:
+            # Progress must never fail the review; if the comment cannot even be created
+            # (e.g. read-only token on a fork PR), stop trying until the final write
+            print(f"Could not update the comment with partial output: {e}")
+            if self.comment_id is None:
+                self._progress_enabled = False
+
+def summarize_diff(diff_text, max_lines_per_file=MAX_LINES_PER_FILE):
+    """Keep each file's header and its first hunk lines, dropping the rest."""
+    parts = []
+    for block in _FILE_SPLIT_RE.split(diff_text):
+        lines = block.splitlines(keepends=True)
+        if len(lines) <= max_lines_per_file:
+            parts.append(block)
+            continue
+        parts.append("".join(lines[:max_lines_per_file]))
+        parts.append(f"... [{len(lines) - max_lines_per_file} more lines truncated]\n")
+    return "".join(parts)
+
+@lru_cache(maxsize=4)
+def _encoder(model_name):
+    """Return the tiktoken encoding for the model (loading it is slow, so it is cached)."""
+    # tiktoken downloads its BPE files on first use; keeping them next to the response cache
+    # lets actions/cache restore them instead of re-downloading on every clean runner
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(CACHE_DIR, "tiktoken"))
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name.split('/')[-1])
+    except KeyError:
+        # Non-OpenAI models: o200k_base is a close enough estimate
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text, model_name):
+    """Count the tokens of text for the model."""
+    return len(_encoder(model_name).encode(text, disallowed_special=()))
+
+def _is_low_value(block):
+    """Tell whether a file's diff is a generated file or a pure rename."""
+    name = _FILE_NAME_RE.search(block)
+    return bool(name and _GENERATED_FILE_RE.search(name.group(1))) or "\nsimilarity index 100%\n" in block
+
+def diff_file_paths(diff_text):
+    """List the changed file paths from the diff headers (fallback when GraphQL metadata is unavailable)."""
+    return [m.group(1) for m in _FILE_NAME_RE.finditer(diff_text)]
+
+def _same_change(removed, added, keep_indent):
+    """Tell whether a run of removed lines and the run of added lines replacing it differ only in whitespace."""
+    if keep_indent:
+        # Only trailing whitespace and blank lines may change
+        return [line.rstrip() for line in removed if line.strip()] == [line.rstrip() for line in added if line.strip()]
+    # Whitespace may move across lines (re-wrapping) or around operators, but the tokens must stay the same
+    return _TOKEN_RE.findall("\n".join(removed)) == _TOKEN_RE.findall("\n".join(added))
+
+def _is_whitespace_only(diff_text):
+    """Tell whether every change of the diff, compared in place, only alters whitespace."""
+    changed = False
+    for block in _FILE_SPLIT_RE.split(diff_text):
+        name = _FILE_NAME_RE.search(block)
+        if not name:
+            continue
+        keep_indent = os.path.splitext(name.group(1))[1].lower() in _INDENT_SENSITIVE_EXTS
+        in_hunk, removed, added = False, [], []
+        # Lines after the first "@@" are hunk lines, whatever they start with ("--- a" can be a removed "-- a")
+        for line in block.splitlines() + [" "]:
+            if line.startswith("@@"):
+                in_hunk = True
+            elif not in_hunk or line.startswith("\\"):
+                continue
+            elif line.startswith("-"):
+                removed.append(line[1:])
+                continue
+            elif line.startswith("+"):
+                added.append(line[1:])
+                continue
+            # Context line or new hunk: the preceding run of changes ends here
+            if removed or added:
+                changed = True
+                if not _same_change(removed, added, keep_indent):
+                    return False
+                removed, added = [], []
+    return changed
+
+def is_trivial_diff(diff_text, file_paths, complete=True):
+    """Tell whether the diff only touches generated files or only changes whitespace."""
+    if file_paths and all(_GENERATED_FILE_RE.search(path) for path in file_paths):
+        return True
+    # A diff cut at MAX_DIFF_BYTES may hide real changes after the whitespace-only part
+    return complete and _is_whitespace_only(diff_text)
+
+def fit_diff_to_budget(diff_text, budget, model_name):
+    """Drop whole files from the diff, low-value and largest first, until it fits in budget tokens."""
+    blocks = _FILE_SPLIT_RE.split(diff_text)
+    costs = [count_tokens(block, model_name) for block in blocks]
+    if sum(costs) <= budget:
+        return diff_text
+
+    kept, used = set(), 0
+    for i in sorted(range(len(blocks)), key=lambda i: (_is_low_value(blocks[i]), costs[i])):
+        if used + costs[i] <= budget:
+            kept.add(i)
+            used += costs[i]
+
+    packed = "".join(blocks[i] for i in sorted(kept))
+    dropped = []
+    for i, block in enumerate(blocks):
+        name = _FILE_NAME_RE.search(block)
+        if i not in kept and name:
+            dropped.append(name.group(1))
+    if dropped:
+        packed += f"\n... [{len(dropped)} files omitted to fit the context window: {', '.join(dropped)}]\n"
+    return packed
+
+def get_relevant_standards(file_paths):
     """Load Markdown standards using absolute paths."""
     standards_content = ""
     standards_path = os.path.join(BASE_DIR, "standards")
-    
-    if not os.path.exists(standards_path):
+
+    # One directory read instead of an exists() call per candidate file
+    try:
+        with os.scandir(standards_path) as it:
+            files = {entry.name: entry for entry in it}
+    except FileNotFoundError:
         return ""
 
-    global_path = os.path.join(standards_path, "global.md")
-    if os.path.exists(global_path):
-        with open(global_path, 'r', encoding='utf-8') as f:
-            standards_content += f"\n--- GLOBAL STANDARDS ---\n{f.read()}\n"
+    if "global.md" in files:
+        standards_content += f"\n--- GLOBAL STANDARDS ---\n{read_standard(files['global.md'])}"
 
-    detected_exts = set()
-    for line in diff_text.splitlines():
-        if line.startswith("+++ b/"):
-            ext = line.split('.')[-1].lower()
-            detected_exts.add(ext)
+    detected_exts = {os.path.splitext(path)[1][1:].lower() for path in file_paths}
 
     mapping = {"py": "python.md", "js": "javascript.md", "jsx": "react.md", "tsx": "react.md", "cs": "csharp.md"}
-    for ext in detected_exts:
+    for ext in sorted(detected_exts):
         std_file = mapping.get(ext)
-        if std_file and os.path.exists(os.path.join(standards_path, std_file)):
-            with open(os.path.join(standards_path, std_file), 'r', encoding='utf-8') as f:
-                standards_content += f"\n--- {ext.upper()} STANDARDS ---\n{f.read()}\n"
+        if std_file in files:
+            standards_content += f"\n--- {ext.upper()} STANDARDS ---\n{read_standard(files[std_file])}"
 
     return standards_content
 
-def main():
+def uses_cache_control(model_name):
+    """Tell whether the model's provider takes explicit cache_control breakpoints (Anthropic-style)."""
+    return LLM_BACKEND == "litellm" and model_name.startswith(CACHE_CONTROL_MODEL_PREFIXES)
+
+def build_messages(system_message, user_message, model_name):
+    """Build chat messages with persona + standards as a cacheable prompt prefix."""
+    # The system block is stable across PRs; only the user message carries the volatile diff.
+    # OpenAI/Azure cache that prefix automatically and reject the marker, so they get plain strings.
+    if not uses_cache_control(model_name):
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ]
+    return [
+        {"role": "system", "content": [
+            {"type": "text", "text": system_message, "cache_control": {"type": "ephemeral"}}
+        ]},
+        {"role": "user", "content": [
+            {"type": "text", "text": user_message}
+        ]}
+    ]
+
+def _cache_db():
+    """Open (and create if needed) the SQLite response cache."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    db = sqlite3.connect(os.path.join(CACHE_DIR, "responses.sqlite3"))
+    db.execute("CREATE TABLE IF NOT EXISTS cache(key TEXT PRIMARY KEY, body TEXT, ts INTEGER)")
+    return db
+
+def cache_key(raw_diff, *parts):
+    """Hash the raw diff bytes and everything else that determines the LLM answer into a cache key."""
+    # Hashing the downloaded bytes directly avoids re-encoding a possibly huge diff string
+    digest = hashlib.sha256(raw_diff)
+    for part in parts:
+        digest.update(b"\0" + part.encode('utf-8'))
+    return digest.hexdigest()
+
+async def get_or_call(key, fn):
+    """Return the cached response for key, or await fn() and store its result."""
+    try:
+        with closing(_cache_db()) as db:
+            row = db.execute("SELECT body FROM cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            print(f"Cache hit for {key[:12]}, skipping LLM call.")
+            return row[0]
+    except sqlite3.Error as e:
+        print(f"Cache unavailable: {e}")
+        return await fn()
+
+    body = await fn()
+    try:
+        # closing() releases the connection, the inner `with db` commits the insert
+        with closing(_cache_db()) as db, db:
+            now = int(time.time())
+            db.execute("DELETE FROM cache WHERE ts < ?", (now - CACHE_TTL_SECONDS,))
+            db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, body, now))
+    except sqlite3.Error as e:
+        print(f"Could not store response in cache: {e}")
+    return body
+
+async def _litellm_chunks(model_name, messages):
+    """Yield the answer's text chunks through LiteLLM."""
+    # Imported lazily: litellm is the slowest import of the launcher and cache hits never need it
+    import litellm
+
+    # LiteLLM routes to Azure if model starts with "azure/"
+    response = await litellm.acompletion(model=model_name, messages=messages, stream=True)
+    async for chunk in response:
+        # Azure sends content-filter chunks without choices
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+async def _direct_chunks(client, model_name, messages):
+    """Yield the answer's text chunks from the OpenAI or Azure chat completions endpoint."""
+    model = model_name.split('/')[-1]
+    api_key = os.getenv("CUSTOM_API_KEY")
+    if LLM_BACKEND == "azure":
+        url = f"{os.getenv('AZURE_API_BASE').rstrip('/')}/openai/deployments/{model}/chat/completions"
+        params = {"api-version": os.getenv("AZURE_API_VERSION")}
+        headers = {"api-key": api_key}
+    else:
+        url = f"{OPENAI_API_BASE.rstrip('/')}/chat/completions"
+        params = {}
+        headers = {"Authorization": f"Bearer {api_key}"}
+
+    async with client.stream(
+        "POST", url, params=params, headers=headers,
+        json={"model": model, "messages": messages, "stream": True}
+    ) as response:
+        if response.is_error:
+            await response.aread()
+            raise RuntimeError(f"{LLM_BACKEND} API returned {response.status_code}: {response.text}")
+        # Server-sent events: one "data: {json}" line per chunk, terminated by "data: [DONE]"
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[len("data: "):]
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            # Azure sends content-filter chunks without choices
+            if chunk.get("choices"):
+                yield chunk["choices"][0]["delta"].get("content") or ""
+
+async def ask_llm(client, model_name, messages, on_progress=None):
+    """Stream the model's answer, reporting the chunks received so far to on_progress."""
+    if LLM_BACKEND == "litellm":
+        chunks = _litellm_chunks(model_name, messages)
+    else:
+        chunks = _direct_chunks(client, model_name, messages)
+    parts = []
+    async for text in chunks:
+        parts.append(text)
+        if on_progress:
+            await on_progress(parts)
+    return "".join(parts)
+
+async def review_diff(client, get_prompt, diff_text, relevant_standards, model_name, on_progress=None):
+    """Fit the diff into the context window, build the agent prompt and ask the model."""
+    # The system prompt does not depend on the diff, so the empty template gives the fixed overhead
+    template = get_prompt("")
+    system_message = f"{template['system']}\n\nHERE ARE THE STANDARDS TO FOLLOW:\n{relevant_standards}"
+    overhead = await asyncio.to_thread(count_tokens, system_message + template["user"], model_name)
+    budget = MAX_INPUT_TOKENS - overhead - RESPONSE_RESERVE_TOKENS
+    diff_text = await asyncio.to_thread(fit_diff_to_budget, diff_text, budget, model_name)
+
+    prompts = get_prompt(diff_text)
+    return await ask_llm(client, model_name, build_messages(system_message, prompts["user"], model_name), on_progress)
+
+async def run_agent(llm, agent_type, model_name, raw_diff, diff_text, relevant_standards, comment, semaphore):
+    """Run one agent on the diff and publish its feedback in comment. Returns False if it could not be posted."""
+    # AI Call (through LLM_BACKEND), skipped when this exact request was already answered
+    # The prompt template is part of the key so edited agent instructions invalidate old answers
+    template = AGENTS[agent_type]("")
+    key = cache_key(
+        raw_diff, model_name, agent_type, str(MAX_INPUT_TOKENS), relevant_standards,
+        template["system"], template["user"]
+    )
+    try:
+        async with semaphore:
+            feedback = await get_or_call(
+                key, lambda: review_diff(llm, AGENTS[agent_type], diff_text, relevant_standards, model_name, comment.update)
+            )
+        
+    except Exception as e:
+        print(f"Error ({agent_type}): {e}")
+        feedback = f"⚠️ **AI Review Failed:** {str(e)}"
+
+    # Post result (replaces the partial output streamed so far); a failure here must not stop the other agents
+    try:
+        await comment.write(feedback)
+    except httpx.HTTPError as e:
+        print(f"Could not post the {agent_type} feedback: {e}")
+        return False
+    return True
+
+async def main():
     # 1. Configuration
     api_key = os.getenv("CUSTOM_API_KEY")
-    model_name = os.getenv("MODEL_NAME", "azure/gpt-4o") # Prefix with azure/
+    model_name = os.getenv("MODEL_NAME") # Prefix with azure/ for Azure, empty for the per-agent default
     
+    if LLM_BACKEND not in LLM_BACKENDS:
+        print(f"Unknown LLM backend '{LLM_BACKEND}', expected one of: {', '.join(LLM_BACKENDS)}")
+        sys.exit(1)
+    if LLM_BACKEND == "azure" and not (os.getenv("AZURE_API_BASE") and os.getenv("AZURE_API_VERSION")):
+        print("The azure backend needs api_base (AZURE_API_BASE) and api_version (AZURE_API_VERSION)")
+        sys.exit(1)
+
     # Azure Specific Variables
     os.environ["AZURE_API_KEY"] = api_key
     os.environ["AZURE_API_BASE"] = os.getenv("AZURE_API_BASE")       # e.g. https://your-resource.openai.azure.com/
@@ -53,42 +548,52 @@ def main():
     repo = os.getenv("GITHUB_REPOSITORY")
     pr_number = os.getenv("GITHUB_REF").split('/')[-2]
 
-    # 2. Retrieve the Diff
-    headers = {"Authorization": f"token {github_token}", "Accept": "application/vnd.github.v3.diff"}
-    diff_text = requests.get(f"https://api.github.com/repos/{repo}/pulls/{pr_number}", headers=headers).text
-
-    # 3. Dynamic Agent Loading
-    try:
-        module_name = f"agents.{agent_type}_agent"
-        agent_module = importlib.import_module(module_name)
-        prompts = agent_module.get_prompt(diff_text)
-    except ImportError as e:
-        print(f"Error importing agent '{agent_type}': {e}")
+    # 2. Agent Selection ("all" runs every agent on a single diff fetch)
+    agent_types = list(AGENTS) if agent_type == "all" else [agent_type]
+    if agent_types[0] not in AGENTS:
+        print(f"Unknown agent '{agent_type}', expected one of: {', '.join(AGENTS)}, all")
         sys.exit(1)
 
-    # 4. Standards
-    relevant_standards = get_relevant_standards(diff_text)
-    system_message = f"{prompts['system']}\n\nHERE ARE THE STANDARDS TO FOLLOW:\n{relevant_standards}"
+    # One HTTP/2 connection to api.github.com is shared by the diff fetch and the comment posts,
+    # and one to the LLM endpoint by every agent (direct backends only)
+    async with github_client() as client, llm_client() as llm:
+        # 3. Retrieve the Diff and the PR metadata (GraphQL) concurrently
+        try:
+            raw_diff, pull_request = await asyncio.gather(
+                fetch_diff(client, repo, pr_number, github_token),
+                fetch_pr_metadata(client, repo, pr_number, github_token)
+            )
+        except httpx.HTTPError as e:
+            print(f"Error: {e}")
+            await post_comment(client, repo, pr_number, github_token, f"⚠️ **AI Review Failed:** could not fetch the diff: {e}")
+            sys.exit(1)
+        diff_text = raw_diff.decode('utf-8', 'replace')
+        # The GraphQL file list is complete even when the downloaded diff was cut at MAX_DIFF_BYTES
+        file_paths = changed_file_paths(pull_request)
+        if file_paths is None:
+            file_paths = diff_file_paths(diff_text)
 
-    # 5. AI Call (Azure Support via LiteLLM)
-    try:
-        # LiteLLM routes to Azure if model starts with "azure/"
-        response = completion(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompts["user"]}
-            ]
-        )
-        feedback = response.choices[0].message.content
-        
-    except Exception as e:
-        print(f"Error: {e}")
-        feedback = f"⚠️ **AI Review Failed:** {str(e)}"
+        # Nothing worth a model call: whitespace-only or generated-only changes
+        if is_trivial_diff(diff_text, file_paths, complete=len(raw_diff) < MAX_DIFF_BYTES):
+            await post_comment(client, repo, pr_number, github_token, TRIVIAL_DIFF_FEEDBACK)
+            return
+
+        if len(raw_diff) > SUMMARIZE_ABOVE_BYTES:
+            diff_text = summarize_diff(diff_text)
+
+        # 4. Standards (blocking file reads run off the event loop)
+        relevant_standards = await asyncio.to_thread(get_relevant_standards, file_paths)
 
-    # 6. Post result
-    comment_url = f"https://api.github.com/repos/{repo}/issues/{pr_number}/comments"
-    requests.post(comment_url, headers={"Authorization": f"token {github_token}"}, json={"body": feedback})
+        # 5. Agents run concurrently, each posting its own comment
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_AGENTS)
+        posted = await asyncio.gather(*(
+            run_agent(llm, name, model_name or MODEL_BY_AGENT[name], raw_diff, diff_text, relevant_standards,
+                      PRComment(client, repo, pr_number, github_token), semaphore)
+            for name in agent_types
+        ))
+
+    if not all(posted):
+        sys.exit(1)
     
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import pytest
+
+import main_launcher
+from main_launcher import _is_low_value, fit_diff_to_budget, summarize_diff
+
+
+def file_diff(path, *lines):
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1 +1 @@\n" + "".join(l + "\n" for l in lines)
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per whitespace-separated word keeps the budgets readable without tiktoken
+    monkeypatch.setattr(main_launcher, "count_tokens", lambda text, model_name: len(text.split()))
+
+
+def test_diff_within_budget_is_unchanged():
+    diff = file_diff("a.py", "+x = 1")
+    assert fit_diff_to_budget(diff, 1000, "gpt-4o") == diff
+
+
+def test_low_value_and_largest_files_are_dropped_first():
+    small = file_diff("small.py", "+a")
+    lock = file_diff("web/yarn.lock", "+b")
+    big = file_diff("big.py", *["+c"] * 20)
+    budget = len(small.split()) + len(lock.split()) + 1
+
+    packed = fit_diff_to_budget(small + lock + big, budget, "gpt-4o")
+
+    assert packed.startswith(small)
+    assert "big.py" not in packed.split("\n... [")[0]
+    # The lockfile still fits, and files keep their original order
+    assert packed.index("small.py") < packed.index("yarn.lock")
+    assert packed.endswith("[1 files omitted to fit the context window: big.py]\n")
+
+
+@pytest.mark.parametrize("budget", [0, -50])
+def test_budget_of_zero_or_less_omits_every_file(budget):
+    diff = file_diff("a.py", "+x") + file_diff("b.py", "+y")
+    packed = fit_diff_to_budget(diff, budget, "gpt-4o")
+    assert packed == "\n... [2 files omitted to fit the context window: a.py, b.py]\n"
+
+
+def test_is_low_value():
+    assert _is_low_value(file_diff("package-lock.json", "+x"))
+    assert _is_low_value(file_diff("dist/app.min.js", "+x"))
+    assert _is_low_value("diff --git a/old.py b/new.py\nsimilarity index 100%\nrename from old.py\nrename to new.py\n")
+    assert not _is_low_value(file_diff("src/app.py", "+x"))
+
+
+def test_summarize_diff_keeps_headers_and_first_lines_of_each_file():
+    long_file = file_diff("long.py", *[f"+line {i}" for i in range(10)])
+    short_file = file_diff("short.py", "+x")
+
+    summary = summarize_diff(long_file + short_file, max_lines_per_file=6)
+
+    assert "diff --git a/long.py b/long.py\n--- a/long.py\n+++ b/long.py\n@@ -1 +1 @@\n+line 0\n+line 1\n" in summary
+    assert "+line 2" not in summary
+    assert "... [8 more lines truncated]\n" in summary
+    assert summary.endswith(short_file)
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import main_launcher
+
+
+def sse(*events):
+    return "".join(f"data: {event}\n\n" for event in events).encode()
+
+
+def delta(text):
+    return json.dumps({"choices": [{"delta": {"content": text}}]})
+
+
+def ask(handler, monkeypatch, backend="openai"):
+    monkeypatch.setattr(main_launcher, "LLM_BACKEND", backend)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await main_launcher.ask_llm(client, "gpt-4o", messages)
+    return asyncio.run(go())
+
+
+def test_stream_is_joined_until_done(monkeypatch):
+    def handler(request):
+        assert request.url == "https://api.openai.com/v1/chat/completions"
+        assert json.loads(request.content)["stream"] is True
+        body = sse(
+            json.dumps({"choices": [], "prompt_filter_results": []}),  # Azure content-filter chunk
+            delta("Hello"),
+            json.dumps({"choices": [{"delta": {}}]}),
+            delta(" world"),
+            "[DONE]",
+            delta(" ignored"),
+        )
+        return httpx.Response(200, content=body, headers={"Content-Type": "text/event-stream"})
+
+    assert ask(handler, monkeypatch) == "Hello world"
+
+
+def test_azure_url_and_api_key(monkeypatch):
+    monkeypatch.setenv("AZURE_API_BASE", "https://name.openai.azure.com/")
+    monkeypatch.setenv("AZURE_API_VERSION", "2024-05-01-preview")
+    monkeypatch.setenv("CUSTOM_API_KEY", "secret")
+
+    def handler(request):
+        assert request.url.path == "/openai/deployments/gpt-4o/chat/completions"
+        assert request.url.params["api-version"] == "2024-05-01-preview"
+        assert request.headers["api-key"] == "secret"
+        return httpx.Response(200, content=sse(delta("ok"), "[DONE]"))
+
+    assert ask(handler, monkeypatch, backend="azure") == "ok"
+
+
+def test_error_status_raises_with_body(monkeypatch):
+    def handler(request):
+        return httpx.Response(401, json={"error": {"message": "Incorrect API key"}})
+
+    with pytest.raises(RuntimeError, match="401.*Incorrect API key"):
+        ask(handler, monkeypatch)
@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main_launcher
+
+
+def fetch(handler):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await main_launcher.fetch_diff(client, "owner/repo", "7", "token")
+    return asyncio.run(go())
+
+
+def test_error_status_raises_instead_of_returning_the_body():
+    def handler(request):
+        return httpx.Response(404, json={"message": "Not Found"})
+
+    with pytest.raises(httpx.HTTPStatusError, match="404"):
+        fetch(handler)
+
+
+def test_body_is_cut_at_max_diff_bytes(monkeypatch):
+    monkeypatch.setattr(main_launcher, "MAX_DIFF_BYTES", 10)
+
+    def handler(request):
+        assert request.headers["Accept"] == "application/vnd.github.v3.diff"
+        return httpx.Response(200, content=b"x" * 25)
+
+    assert fetch(handler) == b"x" * 10
+
+
+def test_rate_limit_is_retried_after_retry_after():
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, content=b"diff --git a/a b/a\n"),
+    ]
+
+    def handler(request):
+        return responses.pop(0)
+
+    assert fetch(handler) == b"diff --git a/a b/a\n"
+    assert not responses
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+
+import main_launcher
+from main_launcher import PRComment
+
+
+def with_comment(handler, scenario):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            comment = PRComment(client, "owner/repo", "7", "token")
+            comment._last_update = -PRComment.UPDATE_INTERVAL  # Make the first update due immediately
+            return await scenario(comment)
+    return asyncio.run(go())
+
+
+def test_failed_create_stops_progress_updates():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(403, json={"message": "Resource not accessible by integration"})
+
+    async def scenario(comment):
+        await comment.update(["x" * PRComment.MIN_CHARS])
+        comment._last_update = -PRComment.UPDATE_INTERVAL
+        await comment.update(["x" * PRComment.MIN_CHARS])
+
+    with_comment(handler, scenario)
+    assert len(requests) == 1
+
+
+def test_failed_progress_patch_does_not_raise():
+    def handler(request):
+        if request.method == "POST":
+            return httpx.Response(201, json={"id": 42})
+        return httpx.Response(500)
+
+    async def scenario(comment):
+        await comment.update(["x" * PRComment.MIN_CHARS])
+        comment._last_update = -PRComment.UPDATE_INTERVAL
+        await comment.update(["y" * PRComment.MIN_CHARS])
+        return comment.comment_id
+
+    assert with_comment(handler, scenario) == 42
+
+
+def test_run_agent_reports_a_failed_final_post(monkeypatch):
+    async def cached(key, fn):
+        return "feedback"
+
+    monkeypatch.setattr(main_launcher, "get_or_call", cached)
+
+    def handler(request):
+        return httpx.Response(403, json={"message": "Forbidden"})
+
+    async def scenario(comment):
+        return await main_launcher.run_agent(
+            None, "reviewer", "gpt-4o", b"diff", "diff", "", comment, asyncio.Semaphore(1)
+        )
+
+    assert with_comment(handler, scenario) is False
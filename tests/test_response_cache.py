@@ -0,0 +1,30 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+
+import main_launcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_get_or_call_caches_and_prunes_expired_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(main_launcher, "CACHE_DIR", str(tmp_path))
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        return "feedback"
+
+    with closing(main_launcher._cache_db()) as db, db:
+        db.execute("INSERT INTO cache VALUES ('old', 'stale', ?)", (int(time.time()) - main_launcher.CACHE_TTL_SECONDS - 1,))
+
+    assert run(main_launcher.get_or_call("key", answer)) == "feedback"
+    assert run(main_launcher.get_or_call("key", answer)) == "feedback"
+    assert len(calls) == 1
+
+    with closing(sqlite3.connect(tmp_path / "responses.sqlite3")) as db:
+        keys = [row[0] for row in db.execute("SELECT key FROM cache")]
+    assert keys == ["key"]
@@ -0,0 +1,88 @@
+from main_launcher import is_trivial_diff
+
+
+def make_diff(path, *hunk_lines):
+    header = f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,3 +1,3 @@\n"
+    return header + "".join(line + "\n" for line in hunk_lines)
+
+
+def test_reformatting_is_trivial():
+    diff = make_diff("app.js", " function f() {", "-  return  x+1;", "+  return x + 1;", " }")
+    assert is_trivial_diff(diff, ["app.js"])
+
+
+def test_rewrapped_call_is_trivial():
+    diff = make_diff("Program.cs", "-Call(a,", "-     b);", "+Call(a, b);")
+    assert is_trivial_diff(diff, ["Program.cs"])
+
+
+def test_trailing_whitespace_in_python_is_trivial():
+    diff = make_diff("app.py", "-x = 1   ", "+x = 1")
+    assert is_trivial_diff(diff, ["app.py"])
+
+
+def test_joined_tokens_are_not_trivial():
+    diff = make_diff("app.js", "-return x;", "+returnx;")
+    assert not is_trivial_diff(diff, ["app.js"])
+
+
+def test_whitespace_inside_string_literal_is_not_trivial():
+    diff = make_diff("app.js", '-let s = "a b";', '+let s = "ab";')
+    assert not is_trivial_diff(diff, ["app.js"])
+
+
+def test_merged_operators_are_not_trivial():
+    diff = make_diff("main.c", "-y = a - -b;", "+y = a--b;")
+    assert not is_trivial_diff(diff, ["main.c"])
+
+
+def test_swapped_statements_are_not_trivial():
+    diff = make_diff("app.js", " function f(x) {", "-  x += 1;", "-  return x;", "+  return x;", "+  x += 1;", " }")
+    assert not is_trivial_diff(diff, ["app.js"])
+
+
+def test_swap_across_context_line_is_not_trivial():
+    diff = make_diff("app.js", "-a();", " b();", "+a();")
+    assert not is_trivial_diff(diff, ["app.js"])
+
+
+def test_python_dedent_is_not_trivial():
+    diff = make_diff("app.py", " for item in items:", "-        return False", "+    return False")
+    assert not is_trivial_diff(diff, ["app.py"])
+
+
+def test_yaml_reindent_is_not_trivial():
+    diff = make_diff("ci.yml", "-  key: value", "+key: value")
+    assert not is_trivial_diff(diff, ["ci.yml"])
+
+
+def test_code_moved_between_files_is_not_trivial():
+    diff = make_diff("a.js", "-helper();") + make_diff("b.js", "+helper();")
+    assert not is_trivial_diff(diff, ["a.js", "b.js"])
+
+
+def test_removed_sql_comment_is_not_trivial():
+    diff = make_diff("schema.sql", " SELECT 1;", "--- DROP TABLE users;")
+    assert not is_trivial_diff(diff, ["schema.sql"])
+
+
+def test_added_line_starting_with_plus_plus_is_not_trivial():
+    diff = make_diff("main.c", "+++ counter;")
+    assert not is_trivial_diff(diff, ["main.c"])
+
+
+def test_diff_without_hunks_is_not_trivial():
+    diff = "diff --git a/logo.png b/logo.png\nBinary files a/logo.png and b/logo.png differ\n"
+    assert not is_trivial_diff(diff, ["logo.png"])
+    assert not is_trivial_diff('{"message": "Not Found"}', [])
+
+
+def test_truncated_diff_is_not_trivial():
+    diff = make_diff("app.js", "-a( );", "+a();")
+    assert not is_trivial_diff(diff, ["app.js"], complete=False)
+
+
+def test_generated_only_changes_are_trivial():
+    diff = make_diff("web/yarn.lock", "+lodash@4.17.21") + make_diff("dist/app.min.js", "+x")
+    assert is_trivial_diff(diff, ["web/yarn.lock", "dist/app.min.js"])
+    assert not is_trivial_diff(diff, ["web/yarn.lock", "src/app.js"])